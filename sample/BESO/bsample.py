@@ -38,10 +38,19 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see https://www.gnu.org/licenses
 """
 
-import os, sys
+import os, sys, mmap, struct, zipfile
+os.environ.setdefault('OMP_NUM_THREADS','1')  # avoid oversubscription, parallelism comes from the workers
+os.environ.setdefault('MKL_NUM_THREADS','1')
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+matplotlib.rcParams['figure.dpi'] = 100  # canvas resolution (figures are drawn to pixels, not saved by savefig)
+matplotlib.rcParams['agg.path.chunksize'] = 10000
 import matplotlib.pyplot as plt
 import matplotlib.collections as clct
+from PIL import Image
 
 file_ini    = 0     # initial file index |from file 0
 file_lim    = 4     # file index limit   |up to file 9264
@@ -49,6 +58,8 @@ fig_top_opt = True  # optimized topology
 fig_top_sen = True  # topology vectors and sensitivity vectors
 fig_dis     = True  # displacements vectors
 fig_obj_vol = True  # objective function and volume
+workers     = os.cpu_count()  # number of processes generating figures
+npz_store   = False # read each f????/ directory from one f????.npz archive (written by bstore.py)
 
 # fixed properties
 Ly = 1.0       # cantilever height
@@ -57,265 +68,388 @@ Ny = 32        # number of elements in y-axis
 Nx = 2*Ny      # number of elements in x-axis
 N = Nx*Ny      # total number of elements
 esize = Ly/Ny  # element size
+px = 9         # pixels per element (images written directly)
+gap = 4        # elements between panels (images written directly)
+png_kwargs = {'compress_level': 1}  # fast png compression (PIL Image.save options)
 
-# check directories
-rpath = '../../dataset/BESO/'
-if not os.path.exists(rpath):
-    print('missing BESO dataset')
-    sys.exit()
-if not os.path.exists('./top_opt'):
-    os.mkdir('./top_opt')
-if not os.path.exists('./top_sen'):
-    os.mkdir('./top_sen')
-if not os.path.exists('./dis'):
-    os.mkdir('./dis')
-if not os.path.exists('./obj_vol'):
-    os.mkdir('./obj_vol')
-
-file = file_ini
-while (file < file_lim) and (os.path.exists(rpath + 'f{:04d}'.format(file))):
-    #%% Read files
-    print('> reading files of f{:04d}'.format(file))
+#%% Figure workers
 
+def setup():
+    # reusable figures of each worker, only the artists data change between samples
+    global io_pool
+    global dis_fig, dis_ax, polys
+    global obj_fig, obj_ax, line_obj, line_vol
+    # png upscaling, encoding and writing overlap with the next frames (one thread per worker)
+    io_pool = ThreadPoolExecutor(max_workers=1)
+    # displacements vectors
+    dis_fig = plt.figure()
+    dis_ax = dis_fig.add_axes([0,0,1,1])  # the figure size follows the mesh limits
+    polys = clct.PolyCollection(np.zeros(((Nx+2)*Ny,4,2)),cmap='gray_r',edgecolor=(0,0,0,0))
+    polys.set_clim(0.0,1.0)
+    dis_ax.add_collection(polys)
+    dis_ax.set_aspect('equal')
+    dis_ax.axis('off')
+    # objective function and volume
+    obj_fig = plt.figure(figsize=(7,7.6))
+    obj_ax = [obj_fig.add_axes([0.15,0.55,0.82,0.43]),obj_fig.add_axes([0.15,0.08,0.82,0.43])]
+    line_obj, = obj_ax[0].plot([],[],'ok-',linewidth=2)
+    obj_ax[0].set_ylabel('compliance [J]',fontsize=18)
+    obj_ax[0].grid()
+    line_vol, = obj_ax[1].plot([],[],'ok-',linewidth=2)
+    obj_ax[1].set_ylabel('volume fraction',fontsize=18)
+    obj_ax[1].grid()
+    obj_ax[1].set_xlabel('iteration',fontsize=18)
+
+def gray_r(xmat):
+    # pixels of imshow(xmat,cmap='gray_r',vmin=0,vmax=1.0,origin='lower')
+    return np.flipud((1.0-xmat)*255.0).astype(np.uint8)
+
+# jet colormap table (last entry: white for nan values)
+jet_lut = np.vstack(((255.0*plt.cm.jet(np.arange(256))[:,:3]).astype(np.uint8),[255,255,255]))
+
+def jet(qmat):
+    # pixels of imshow(amat,cmap='jet',vmin=np.log(1e-6),vmax=np.log(1.0+1e-6),origin='lower')
+    return jet_lut[np.flipud(qmat)]
+
+def write_png(path, img):
+    # one pixel per element, upscaled without interpolation
+    img = Image.fromarray(img)
+    img = img.resize((px*img.width,px*img.height),resample=Image.NEAREST)
+    img.save(path,optimize=False,**png_kwargs)
+
+def save_png(path, img):
+    # frame copied now (the panel buffers are reused), upscaled and written in background
+    return io_pool.submit(write_png,path,np.array(img))
+
+def save_fig(path, fig):
+    # figure rendered now, written in background
+    fig.canvas.draw()
+    img = Image.fromarray(np.array(fig.canvas.buffer_rgba()))
+    return io_pool.submit(img.save,path,optimize=False,**png_kwargs)
+
+def wait(writes):
+    for write in writes:
+        write.result()
+
+def topologies(c0, c1, list_top):
+    # unpacked topology vectors written next to the boundary columns (order='F' matrices transposed)
+    tops = np.empty((len(list_top),Nx+2,Ny),dtype=np.float32)
+    tops[:,0] = c0
+    tops[:,-1] = c1
+    tops[:,1:-1] = np.unpackbits(list_top,axis=1).reshape(-1,Nx,Ny)
+    return tops
+
+def plot_top_opt(fid, xmat):
+    # figure
+    save_png('./top_opt/f{:06d}.png'.format(fid),gray_r(xmat)).result()
+
+def plot_top_sen(fid, c0, c1, list_top, list_sen_0, list_sen_1, list_sen_2, list_sen_w):
+    # panels (3 x 2) : topology | CGS-0 / empty | CGS-1 / WS | CGS-2
+    img = np.full((3*Ny+2*gap,2*(Nx+2)+gap,3),255,dtype=np.uint8)
+    row = [slice(0,Ny),slice(Ny+gap,2*Ny+gap),slice(2*Ny+2*gap,3*Ny+2*gap)]
+    col = [slice(1,Nx+1),slice(Nx+2+gap+1,2*Nx+2+gap+1)]
+    # topology vectors
+    tops = topologies(c0,c1,list_top)
+    # sensitivity matrices (order='F') : log of the sensitivities normalized in each iteration
+    amats = np.stack((list_sen_0,list_sen_1,list_sen_2,list_sen_w),axis=1).astype(np.float32)
+    mval = np.maximum(amats.max(axis=(1,2)),-amats.min(axis=(1,2)))  # max(abs) without the abs copy
+    amats /= mval[:,None,None]
+    np.subtract(1e-6,amats,out=amats)
+    np.log(amats,out=amats)
+    # colormap bins (vmin=np.log(1e-6), vmax=np.log(1.0+1e-6)), 256 for nan
+    amats -= np.log(1e-6)
+    amats *= 256/(np.log(1.0+1e-6)-np.log(1e-6))
+    np.clip(amats,0,255,out=amats)
+    amats[np.isnan(amats)] = 256
+    qmats = amats.astype(np.uint16).reshape(-1,4,Nx,Ny).transpose(0,1,3,2)
+    writes = []
+    for j in range(len(list_top)):
+        # figure
+        img[row[0],:Nx+2] = gray_r(tops[j].T)[:,:,None]
+        img[row[0],col[1]] = jet(qmats[j,0])
+        img[row[1],col[1]] = jet(qmats[j,1])
+        img[row[2],col[1]] = jet(qmats[j,2])
+        img[row[2],col[0]] = jet(qmats[j,3])
+        writes += [save_png('./top_sen/f{:06d}_{:03d}.png'.format(fid,j),img)]
+    wait(writes)
+
+def plot_dis(fid, c0, c1, coor, inci, list_top, list_dis):
+    # topology vectors
+    tops = topologies(c0,c1,list_top)
+    # displaced coordinates (scale of the first iteration)
+    scale = 0.50*Ly/np.abs(list_dis[0]).max()
+    ug = np.concatenate((list_dis[:,:66],list_dis,list_dis[:,-66:]),axis=1)
+    coor_dis = coor + scale*np.reshape(ug,(len(ug),)+coor.shape)
+    # figure limits (first iteration)
+    xmax = coor_dis[0,:,0].max()
+    xmin = coor_dis[0,:,0].min()
+    ymax = coor_dis[0,:,1].max()
+    ymin = coor_dis[0,:,1].min()
+    Dx = xmax-xmin
+    Dy = ymax-ymin
+    dis_ax.set_xlim([xmin-0.01*Dx,xmax+0.01*Dx])
+    dis_ax.set_ylim([ymin-0.05*Dy,ymax+0.01*Dy])
+    size = min([6.0/(1.02*Dx),4.5/(1.06*Dy)])
+    dis_fig.set_size_inches(size*1.02*Dx,size*1.06*Dy)
+    writes = []
+    for j in range(len(list_top)):
+        # figure
+        polys.set_verts(coor_dis[j][inci])
+        polys.set_array(tops[j].ravel())
+        writes += [save_fig('./dis/f{:06d}_{:03d}.png'.format(fid,j),dis_fig)]
+    wait(writes)
+
+def plot_obj_vol(fid, obj, vol, obj_min, obj_max):
+    delta = obj_max - obj_min
+    miny = obj_min-0.02*delta
+    maxy = obj_max+0.02*delta
+    line_obj.set_data(range(len(obj)),obj)
+    obj_ax[0].axis([-0.75, len(obj)-0.25, miny, maxy])
+    line_vol.set_data(range(len(vol)),vol)
+    obj_ax[1].axis([-0.75, len(obj)-0.25, -0.05, 1.05])
+    save_fig('./obj_vol/f{:06d}.png'.format(fid),obj_fig).result()
+
+#%% Dataset reader
+
+def touch(array):
+    # fault the mapped pages in (one byte per page), the disk reads happen in the reader thread
+    if array.size > 0:
+        array.ravel(order='K').view(np.uint8)[::mmap.PAGESIZE].max()
+    return array
+
+def load(path):
+    # memory-mapped array, read ahead by the reader thread
+    return touch(np.load(path,mmap_mode='r'))
+
+def load_store(file):
+    # all arrays of a directory in one uncompressed archive, memory-mapped in place
+    store = rpath + 'f{:04d}.npz'.format(file)
+    if not os.path.exists(store):
+        print('missing : f{:04d}.npz (run bstore.py)'.format(file))
+        sys.exit()
+    keys = ['fid','inp','ptr2opt']
+    if fig_top_opt:
+        keys += ['top_opt']
+    if fig_top_sen or fig_dis:
+        keys += ['top']
+    if fig_top_sen:
+        keys += ['sen_0','sen_1','sen_2','sen_w']
+    if fig_dis:
+        keys += ['dis']
+    if fig_obj_vol:
+        keys += ['obj','vol']
+    data = {}
+    with zipfile.ZipFile(store) as zf, open(store,'rb') as fs:
+        members = set(zf.namelist())
+        for name in keys:
+            if name + '.npy' not in members:
+                print('missing : f{:04d}.npz/{}.npy'.format(file,name))
+                sys.exit()
+            info = zf.getinfo(name + '.npy')
+            if info.compress_type != zipfile.ZIP_STORED:
+                print('compressed : f{:04d}.npz/{}.npy (run bstore.py)'.format(file,name))
+                sys.exit()
+            # the stored member starts after its local header (fixed part plus name and extra field)
+            fs.seek(info.header_offset + 26)
+            name_len, extra_len = struct.unpack('<HH',fs.read(4))
+            fs.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(fs)
+            if version == (1,0):
+                shape, fortran, dtype = np.lib.format.read_array_header_1_0(fs)
+            else:
+                shape, fortran, dtype = np.lib.format.read_array_header_2_0(fs)
+            data[name] = touch(np.memmap(store,dtype=dtype,mode='r',offset=fs.tell(),shape=shape,order='F' if fortran else 'C'))
+    return data
+
+def load_file(file):
+    if npz_store:
+        return load_store(file)
+    names = set(os.listdir(rpath + 'f{:04d}'.format(file)))  # one listing instead of a stat per array
+    data = {}
     # input files id, input data and pointers to optimization
-    if not os.path.exists(rpath + 'f{:04d}/fid.npy'.format(file)):
+    if 'fid.npy' not in names:
         print('missing : f{:04d}/fid.npy'.format(file))
         sys.exit()
-    list_fid = np.load(rpath + 'f{:04d}/fid.npy'.format(file))
-    if not os.path.exists(rpath + 'f{:04d}/inp.npy'.format(file)):
+    data['fid'] = load(rpath + 'f{:04d}/fid.npy'.format(file))
+    if 'inp.npy' not in names:
         print('missing : f{:04d}/inp.npy'.format(file))
         sys.exit()
-    list_inp = np.load(rpath + 'f{:04d}/inp.npy'.format(file))
-    if not os.path.exists(rpath + 'f{:04d}/ptr2opt.npy'.format(file)):
+    data['inp'] = load(rpath + 'f{:04d}/inp.npy'.format(file))
+    if 'ptr2opt.npy' not in names:
         print('missing : f{:04d}/ptr2opt.npy'.format(file))
         sys.exit()
-    list_ptr2opt = np.load(rpath + 'f{:04d}/ptr2opt.npy'.format(file))
+    data['ptr2opt'] = load(rpath + 'f{:04d}/ptr2opt.npy'.format(file))
     
     # optimized topology
     if fig_top_opt:
-        if not os.path.exists(rpath + 'f{:04d}/top_opt.npy'.format(file)):
+        if 'top_opt.npy' not in names:
             print('missing : f{:04d}/top_opt.npy'.format(file))
             sys.exit()
-        list_top_opt = np.load(rpath + 'f{:04d}/top_opt.npy'.format(file))
+        data['top_opt'] = load(rpath + 'f{:04d}/top_opt.npy'.format(file))
     
     # topology vectors
     if fig_top_sen or fig_dis:
-        if not os.path.exists(rpath + 'f{:04d}/top.npy'.format(file)):
+        if 'top.npy' not in names:
             print('missing : f{:04d}/top.npy'.format(file))
             sys.exit()
-        list_top = np.load(rpath + 'f{:04d}/top.npy'.format(file))
+        data['top'] = load(rpath + 'f{:04d}/top.npy'.format(file))
         
     # sensitivity vectors
     if fig_top_sen:
-        if not os.path.exists(rpath + 'f{:04d}/sen_0.npy'.format(file)):
+        if 'sen_0.npy' not in names:
             print('missing : f{:04d}/sen_0.npy'.format(file))
             sys.exit()
-        list_sen_0 = np.load(rpath + 'f{:04d}/sen_0.npy'.format(file))
-        if not os.path.exists(rpath + 'f{:04d}/sen_1.npy'.format(file)):
+        data['sen_0'] = load(rpath + 'f{:04d}/sen_0.npy'.format(file))
+        if 'sen_1.npy' not in names:
             print('missing : f{:04d}/sen_1.npy'.format(file))
             sys.exit()
-        list_sen_1 = np.load(rpath + 'f{:04d}/sen_1.npy'.format(file))
-        if not os.path.exists(rpath + 'f{:04d}/sen_2.npy'.format(file)):
+        data['sen_1'] = load(rpath + 'f{:04d}/sen_1.npy'.format(file))
+        if 'sen_2.npy' not in names:
             print('missing : f{:04d}/sen_2.npy'.format(file))
             sys.exit()
-        list_sen_2 = np.load(rpath + 'f{:04d}/sen_2.npy'.format(file))
-        if not os.path.exists(rpath + 'f{:04d}/sen_w.npy'.format(file)):
+        data['sen_2'] = load(rpath + 'f{:04d}/sen_2.npy'.format(file))
+        if 'sen_w.npy' not in names:
             print('missing : f{:04d}/sen_w.npy'.format(file))
             sys.exit()
-        list_sen_w = np.load(rpath + 'f{:04d}/sen_w.npy'.format(file))
+        data['sen_w'] = load(rpath + 'f{:04d}/sen_w.npy'.format(file))
     
     # displacements vectors
     if fig_dis:
-        if not os.path.exists(rpath + 'f{:04d}/dis.npy'.format(file)):
+        if 'dis.npy' not in names:
             print('missing : f{:04d}/dis.npy'.format(file))
             sys.exit()
-        list_dis = np.load(rpath + 'f{:04d}/dis.npy'.format(file))
+        data['dis'] = load(rpath + 'f{:04d}/dis.npy'.format(file))
         
     # objective function and volume
     if fig_obj_vol:
-        if not os.path.exists(rpath + 'f{:04d}/obj.npy'.format(file)):
+        if 'obj.npy' not in names:
             print('missing : f{:04d}/obj.npy'.format(file))
             sys.exit()
-        list_obj = np.load(rpath + 'f{:04d}/obj.npy'.format(file))
-        if not os.path.exists(rpath + 'f{:04d}/vol.npy'.format(file)):
+        data['obj'] = load(rpath + 'f{:04d}/obj.npy'.format(file))
+        if 'vol.npy' not in names:
             print('missing : f{:04d}/vol.npy'.format(file))
             sys.exit()
-        list_vol = np.load(rpath + 'f{:04d}/vol.npy'.format(file))
-    
-    #%% Generate figures
-    print(': generating figures')
-    
-    # optimized topology
-    if fig_top_opt:
-        print(': : optimized topology...')
-        for k in range(len(list_fid)):
-            # boundary conditions
-            fid = list_fid[k]
-            inp = list_inp[k]
-            ycoor = esize*np.array(list(range(Ny+1)))-0.5*Ly
-            mask = (ycoor > inp[0]-inp[1]-small) & (ycoor < inp[0]+inp[1]+small)
-            c0 = np.zeros((32,1))
-            c0[mask[1:]]  += 0.25 
-            c0[mask[:-1]] += 0.25
-            mask = (ycoor > inp[2]-inp[3]-small) & (ycoor < inp[2]+inp[3]+small)
-            c1 = np.zeros((32,1))
-            c1[mask[1:]]  += 0.25 
-            c1[mask[:-1]] += 0.25
-            # figure
-            plt.figure(num=0).clear()
-            fig,ax = plt.subplots(num=0)
-            x = list_top_opt[k]
-            x = np.unpackbits(x,axis=None).astype(float)
-            xmat = np.reshape(x,(Ny,Nx),order='F')
-            xmat = np.concatenate((c0,xmat,c1),axis=1)
-            ax.imshow(xmat,cmap='gray_r',vmin=0,vmax=1.0,origin='lower')
-            ax.axis('off')
-            fig.set_size_inches(8, 4)
-            plt.savefig('./top_opt/f{:06d}.png'.format(fid),bbox_inches='tight',pad_inches=0.05,dpi=100)
-    
-    # topology vectors and sensitivity vectors
-    if fig_top_sen:
-        print(': : topology vectors and sensitivity vectors...')
-        for k in range(len(list_fid)):
-            # boundary conditions
-            fid = list_fid[k]
-            inp = list_inp[k]
-            ycoor = esize*np.array(list(range(Ny+1)))-0.5*Ly
-            mask = (ycoor > inp[0]-inp[1]-small) & (ycoor < inp[0]+inp[1]+small)
-            c0 = np.zeros((32,1))
-            c0[mask[1:]]  += 0.25 
-            c0[mask[:-1]] += 0.25
-            mask = (ycoor > inp[2]-inp[3]-small) & (ycoor < inp[2]+inp[3]+small)
-            c1 = np.zeros((32,1))
-            c1[mask[1:]]  += 0.25 
-            c1[mask[:-1]] += 0.25
-            j = 0
-            for kk in range(list_ptr2opt[k],list_ptr2opt[k+1]):
-                # figure
-                plt.figure(num=0).clear()
-                fig,ax = plt.subplots(nrows=3,ncols=2,num=0)
-                x = list_top[kk]
-                x = np.unpackbits(x,axis=None).astype(float)
-                xmat = np.reshape(x,(Ny,Nx),order='F')
-                xmat = np.concatenate((c0,xmat,c1),axis=1)
-                ax[0,0].imshow(xmat,cmap='gray_r',vmin=0,vmax=1.0,origin='lower')
-                ax[0,0].axis('off')
-                alpha_0 = list_sen_0[kk].astype(float)
-                alpha_1 = list_sen_1[kk].astype(float)
-                alpha_2 = list_sen_2[kk].astype(float)
-                alpha_w = list_sen_w[kk].astype(float)
-                mval = max([max(abs(alpha_0)),max(abs(alpha_1)),max(abs(alpha_2)),max(abs(alpha_w))])
-                alpha_0 = alpha_0/mval
-                alpha_1 = alpha_1/mval
-                alpha_2 = alpha_2/mval
-                alpha_w = alpha_w/mval
-                amat = np.reshape(np.log(-alpha_0+1e-6),(Ny,Nx),order='F')
-                ax[0,1].imshow(amat,cmap='jet',vmin=np.log(1e-6),vmax=np.log(1.0+1e-6),origin='lower')
-                ax[0,1].axis('off')
-                amat = np.reshape(np.log(-alpha_1+1e-6),(Ny,Nx),order='F')
-                ax[1,1].imshow(amat,cmap='jet',vmin=np.log(1e-6),vmax=np.log(1.0+1e-6),origin='lower')
-                ax[1,1].axis('off')
-                amat = np.reshape(np.log(-alpha_2+1e-6),(Ny,Nx),order='F')
-                ax[2,1].imshow(amat,cmap='jet',vmin=np.log(1e-6),vmax=np.log(1.0+1e-6),origin='lower')
-                ax[2,1].axis('off')
-                amat = np.reshape(np.log(-alpha_w+1e-6),(Ny,Nx),order='F')
-                ax[2,0].imshow(amat,cmap='jet',vmin=np.log(1e-6),vmax=np.log(1.0+1e-6),origin='lower')
-                ax[2,0].axis('off')
-                ax[1,0].axis('off')
-                fig.set_size_inches(12, 9)
-                plt.savefig('./top_sen/f{:06d}_{:03d}.png'.format(fid,j),bbox_inches='tight',pad_inches=0.05,dpi=100)
-                j += 1
-        
-    # displacements vectors
+        data['vol'] = load(rpath + 'f{:04d}/vol.npy'.format(file))
+    return data
+
+def prefetch(files, depth=2):
+    # read the next files while the figures of the current one are generated
+    with ThreadPoolExecutor(max_workers=depth) as reader:
+        tasks = [reader.submit(load_file,file) for file in files[:depth]]
+        for k in range(len(files)):
+            if k+depth < len(files):
+                tasks += [reader.submit(load_file,files[k+depth])]
+            yield files[k], tasks[k].result()
+            tasks[k] = None
+
+if __name__ == '__main__':  # the figure workers may be spawned (they import this module)
+    # check directories
+    rpath = '../../dataset/BESO/'
+    if not os.path.exists(rpath):
+        print('missing BESO dataset')
+        sys.exit()
+    if not os.path.exists('./top_opt'):
+        os.mkdir('./top_opt')
+    if not os.path.exists('./top_sen'):
+        os.mkdir('./top_sen')
+    if not os.path.exists('./dis'):
+        os.mkdir('./dis')
+    if not os.path.exists('./obj_vol'):
+        os.mkdir('./obj_vol')
+
+    # figure workers
+    pool = ProcessPoolExecutor(max_workers=workers,mp_context=mp.get_context(),initializer=setup)
+    pool.submit(int).result()  # start the workers before the reader threads
+
+    # mesh of the padded domain (same for every file)
     if fig_dis:
-        print(': : displacements vectors...')
         # coordinates matrix
-        xcoor = (Ny+1)*[list(range(Nx+2+1))]
-        xcoor = np.ravel(xcoor,'F')
-        ycoor = (Nx+2+1)*[list(range(Ny+1))]
-        ycoor = np.ravel(ycoor,'C')
+        xcoor = np.ravel(np.broadcast_to(np.arange(Nx+2+1),(Ny+1,Nx+2+1)),'F')
+        ycoor = np.ravel(np.broadcast_to(np.arange(Ny+1),(Nx+2+1,Ny+1)),'C')
         coor = esize*np.array([xcoor,ycoor]).T
         coor[:,1] = coor[:,1] - 0.5*Ly
         # incidence matrix
-        N = (Nx+2)*Ny
-        inci = np.ndarray([N,4],dtype=int)
-        elem_ids = np.arange(N)
+        Np = (Nx+2)*Ny
+        inci = np.empty((Np,4),dtype=np.int32)
+        elem_ids = np.arange(Np)
         inci[:,0] = elem_ids + elem_ids//Ny
         inci[:,1] = inci[:,0] + Ny + 1
         inci[:,2] = inci[:,0] + Ny + 2
         inci[:,3] = inci[:,0] + 1
-        for k in range(len(list_fid)):
-            # boundary conditions
-            fid = list_fid[k]
-            inp = list_inp[k]
-            ycoor = esize*np.array(list(range(Ny+1)))-0.5*Ly
-            mask = (ycoor > inp[0]-inp[1]-small) & (ycoor < inp[0]+inp[1]+small)
-            c0 = np.zeros(32)
-            c0[mask[1:]]  += 0.25 
-            c0[mask[:-1]] += 0.25
-            mask = (ycoor > inp[2]-inp[3]-small) & (ycoor < inp[2]+inp[3]+small)
-            c1 = np.zeros(32)
-            c1[mask[1:]]  += 0.25 
-            c1[mask[:-1]] += 0.25
-            j = 0
-            for kk in range(list_ptr2opt[k],list_ptr2opt[k+1]):
-                # figure
-                plt.figure(num=0).clear()
-                fig,ax = plt.subplots(num=0)
-                ug = list_dis[kk]
-                if j == 0:
-                    scale = 0.50*Ly/max(abs(ug))
-                ug = np.concatenate((ug[:66],ug,ug[-66:]))
-                umat = np.reshape(ug,coor.shape)
-                coor_dis = coor + scale*umat
-                if j == 0:
-                    xmax = max(coor_dis[:,0])
-                    xmin = min(coor_dis[:,0])
-                    ymax = max(coor_dis[:,1])
-                    ymin = min(coor_dis[:,1])
-                    Dx = xmax-xmin
-                    Dy = ymax-ymin
-                polys = clct.PolyCollection(coor_dis[inci],cmap='gray_r',edgecolor=(0,0,0,0))
-                x = list_top[kk]
-                x = np.unpackbits(x,axis=None).astype(float)
-                x = np.concatenate((c0,x,c1))
-                polys.set_array(x)
-                polys.set_clim(0.0,1.0)
-                ax.add_collection(polys)
-                ax.set_aspect('equal')
-                ax.set_xlim([xmin-0.01*Dx,xmax+0.01*Dx])
-                ax.set_ylim([ymin-0.05*Dy,ymax+0.01*Dy])
-                ax.axis('off')
-                fig.set_size_inches(8, 6)
-                fig.savefig('./dis/f{:06d}_{:03d}.png'.format(fid,j),bbox_inches='tight',pad_inches=0,dpi=100)
-                j += 1
+
+    # dataset directories (one scan instead of a stat per file)
+    dirs = {entry.name for entry in os.scandir(rpath) if entry.is_dir()}
+    files = []
+    file = file_ini
+    while (file < file_lim) and ('f{:04d}'.format(file) in dirs):
+        files += [file]
+        file = file + 1
+
+    pending = []  # figures of the previous file
+    for file,data in prefetch(files):
+        #%% Read files
+        print('> reading files of f{:04d}'.format(file))
+        list_fid     = data['fid']
+        list_inp     = data['inp']
+        list_ptr2opt = data['ptr2opt']
+        list_top_opt = data.get('top_opt')
+        list_top     = data.get('top')
+        list_sen_0   = data.get('sen_0')
+        list_sen_1   = data.get('sen_1')
+        list_sen_2   = data.get('sen_2')
+        list_sen_w   = data.get('sen_w')
+        list_dis     = data.get('dis')
+        list_obj     = data.get('obj')
+        list_vol     = data.get('vol')
+    
+        #%% Generate figures
+        print(': generating figures')
+        tasks = []  # figures of this file (the previous file's figures may still be running)
+    
+        # boundary conditions
+        ycoor = esize*np.arange(Ny+1)-0.5*Ly
+        mask = (ycoor > (list_inp[:,0]-list_inp[:,1]-small)[:,None]) & (ycoor < (list_inp[:,0]+list_inp[:,1]+small)[:,None])
+        list_c0 = 0.25*mask[:,1:] + 0.25*mask[:,:-1]
+        mask = (ycoor > (list_inp[:,2]-list_inp[:,3]-small)[:,None]) & (ycoor < (list_inp[:,2]+list_inp[:,3]+small)[:,None])
+        list_c1 = 0.25*mask[:,1:] + 0.25*mask[:,:-1]
+    
+        # optimized topology
+        if fig_top_opt:
+            print(': : optimized topology...')
+            tops_opt = topologies(list_c0,list_c1,list_top_opt)
+            for k in range(len(list_fid)):
+                tasks += [pool.submit(plot_top_opt,list_fid[k],tops_opt[k].T)]
+    
+        # topology vectors and sensitivity vectors
+        if fig_top_sen:
+            print(': : topology vectors and sensitivity vectors...')
+            for k in range(len(list_fid)):
+                opt = slice(list_ptr2opt[k],list_ptr2opt[k+1])
+                tasks += [pool.submit(plot_top_sen,list_fid[k],list_c0[k],list_c1[k],list_top[opt],
+                                      list_sen_0[opt],list_sen_1[opt],list_sen_2[opt],list_sen_w[opt])]
+        
+        # displacements vectors
+        if fig_dis:
+            print(': : displacements vectors...')
+            for k in range(len(list_fid)):
+                opt = slice(list_ptr2opt[k],list_ptr2opt[k+1])
+                tasks += [pool.submit(plot_dis,list_fid[k],list_c0[k],list_c1[k],coor,inci,list_top[opt],list_dis[opt])]
                 
-    # objective function and volume
-    if fig_obj_vol:
-        print(': : objective function and volume...')
-        for k in range(len(list_fid)):
-            fid = list_fid[k]
-            plt.figure(num=0).clear()
-            fig,ax = plt.subplots(nrows=2,ncols=1,num=0)
-            obj = list_obj[list_ptr2opt[k]:list_ptr2opt[k+1]]
-            delta = max(obj) - min(obj)
-            miny = min(obj)-0.02*delta
-            maxy = max(obj)+0.02*delta
-            ax[0].plot(obj,'ok-',linewidth=2)
-            ax[0].axis([-0.75, len(obj)-0.25, miny, maxy])
-            ax[0].set_ylabel('compliance [J]',fontsize=18)
-            ax[0].grid()
-            vol = list_vol[list_ptr2opt[k]:list_ptr2opt[k+1]]
-            ax[1].plot(vol,'ok-',linewidth=2)
-            ax[1].axis([-0.75, len(obj)-0.25, -0.05, 1.05])
-            ax[1].set_ylabel('volume fraction',fontsize=18)
-            ax[1].grid()
-            ax[1].set_xlabel('iteration',fontsize=18)
-            fig.set_size_inches(8, 9)
-            fig.savefig('./obj_vol/f{:06d}.png'.format(fid),bbox_inches='tight',pad_inches=0.05,dpi=100)
-
-    # prepare to read next file
-    file = file + 1
-
-plt.close(fig=0)
-print('done!')
+        # objective function and volume
+        if fig_obj_vol:
+            print(': : objective function and volume...')
+            # compliance range of each optimization
+            list_obj_min = np.minimum.reduceat(list_obj,list_ptr2opt[:-1])
+            list_obj_max = np.maximum.reduceat(list_obj,list_ptr2opt[:-1])
+            for k in range(len(list_fid)):
+                opt = slice(list_ptr2opt[k],list_ptr2opt[k+1])
+                tasks += [pool.submit(plot_obj_vol,list_fid[k],list_obj[opt],list_vol[opt],list_obj_min[k],list_obj_max[k])]
+    
+        # wait for the figures of the previous file (the workers are kept busy with this one)
+        wait(pending)
+        pending = tasks
+
+    # wait for the workers
+    wait(pending)
+    pool.shutdown()
+    print('done!')
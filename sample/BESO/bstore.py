@@ -0,0 +1,72 @@
+"""
+Dataset Generation (npz stores for bsample.py)
+Topology Optimization of a Cantilever Beam
+--------------------------------------------------------------------
+Laboratory of Topology Optimization and Multiphysics Analysis
+Department of Computational Mechanics
+School of Mechanical Engineering
+University of Campinas (Brazil)
+--------------------------------------------------------------------
+author  : Daniel Candeloro Cunha
+version : 1.0
+date    : May 2022
+--------------------------------------------------------------------
+To collaborate or report bugs, please look for the author's email
+address at https://www.fem.unicamp.br/~ltm/
+
+All codes and documentation are publicly available in the following
+github repository: https://github.com/Joquempo/Cantilever-Dataset
+
+If you use this program (or the data generated by it) in your work,
+the developer would be grateful if you would cite the indicated
+references. They are listed in the "CITEAS" file available in the
+github repository.
+--------------------------------------------------------------------
+Copyright (C) 2022 Daniel Candeloro Cunha
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see https://www.gnu.org/licenses
+"""
+
+import os, sys
+import numpy as np
+
+file_ini = 0     # initial file index |from file 0
+file_lim = 9265  # file index limit   |up to file 9264
+names = ['fid','inp','ptr2opt','top_opt','top','sen_0','sen_1','sen_2','sen_w','dis','obj','vol']
+
+# check directories
+rpath = '../../dataset/BESO/'
+if not os.path.exists(rpath):
+    print('missing BESO dataset')
+    sys.exit()
+
+# pack the arrays of each f????/ directory into one uncompressed f????.npz (read by bsample.py with npz_store)
+dirs = {entry.name for entry in os.scandir(rpath) if entry.is_dir()}
+file = file_ini
+while (file < file_lim) and ('f{:04d}'.format(file) in dirs):
+    store = rpath + 'f{:04d}.npz'.format(file)
+    if not os.path.exists(store):
+        print('packing : f{:04d}'.format(file))
+        files = set(os.listdir(rpath + 'f{:04d}'.format(file)))
+        data = {}
+        for name in names:
+            if name + '.npy' not in files:
+                print('missing : f{:04d}/{}.npy'.format(file,name))
+                sys.exit()
+            data[name] = np.load(rpath + 'f{:04d}/{}.npy'.format(file,name),mmap_mode='r')
+        np.savez(rpath + 'f{:04d}.tmp.npz'.format(file),**data)
+        os.replace(rpath + 'f{:04d}.tmp.npz'.format(file),store)
+        del data
+    file = file + 1
+print('done!')
@@ -43,6 +43,7 @@ along with this program.  If not, see https://www.gnu.org/licenses
 # cython: cdivision=True
 
 cimport cython
+import numpy as np
 
 cdef void cgs_0_serial(double [:] alpha_r, double [:,::1] dKe, double [:] ug, long long Nx, long long Ny):
     cdef long long N
@@ -394,6 +395,136 @@ cdef void cgs_2J_serial(double [:] alpha_r, long long [:] dens, double [:] data,
         alpha_r[e] = sval
     return
 
+cdef inline void heap_push(long long [:] heap, long long *size, long long val):
+    cdef long long k
+    cdef long long up
+    k = size[0]
+    size[0] = k + 1
+    while k > 0:
+        up = (k-1)//2
+        if heap[up] <= val:
+            break
+        heap[k] = heap[up]
+        k = up
+    heap[k] = val
+    return
+
+cdef inline long long heap_pop(long long [:] heap, long long *size):
+    cdef long long k
+    cdef long long down
+    cdef long long val
+    cdef long long top
+    top = heap[0]
+    size[0] = size[0] - 1
+    val = heap[size[0]]
+    k = 0
+    while 2*k+1 < size[0]:
+        down = 2*k+1
+        if (down+1 < size[0]) and (heap[down+1] < heap[down]):
+            down = down + 1
+        if val <= heap[down]:
+            break
+        heap[k] = heap[down]
+        k = down
+    heap[k] = val
+    return top
+
+cdef void ws_serial(double [:] alpha_r, long long [:] dens, double [:] data, long long [:] row_ind, long long [:] col_ptr, long long [:] heap, long long [:] mark, long long [:] pinv, double [:] diag, long long [:] bc_lim, double [:,::1] H, double [:,::1] H_01, double [:,::1] H_67, double [:,::1] H_0167, double [:] ur, double [:,::1] W, long long Nx, long long Ny):
+    cdef long long N
+    cdef long long e
+    cdef long long k1
+    cdef long long k2
+    cdef long long k3
+    cdef long long i
+    cdef long long j
+    cdef long long size
+    cdef long long ndof
+    cdef long long rank
+    cdef double val
+    cdef double sval
+    cdef double[:,::1] He
+    cdef long long nodes[4]
+    cdef long long free_nodes[4]
+    cdef long long gv[8]
+    cdef double vi[5]
+    cdef double Mi[5][5]
+    N = Nx*Ny
+    for e in range(N):
+        nodes[0] = e + e//Ny
+        nodes[1] = nodes[0] + Ny + 1
+        nodes[2] = nodes[1] + 1
+        nodes[3] = nodes[0] + 1
+        # reduced DOFs of the free nodes
+        ndof = 0
+        for k1 in range(4):
+            free_nodes[k1] = (nodes[k1] < bc_lim[0]) or (nodes[k1] > bc_lim[1])
+            if free_nodes[k1]:
+                if nodes[k1] > bc_lim[1]:
+                    nodes[k1] = nodes[k1] - (bc_lim[1]-bc_lim[0]+1)
+                gv[ndof] = 2*nodes[k1]
+                gv[ndof+1] = gv[ndof] + 1
+                ndof = ndof + 2
+        rank = 5
+        if free_nodes[0] and free_nodes[3]:
+            He = H
+        elif (not free_nodes[0]) and free_nodes[3]:
+            He = H_01
+        elif free_nodes[0] and (not free_nodes[3]):
+            He = H_67
+        else:
+            He = H_0167
+            rank = 4
+        # sparse forward substitution (unit L), only the columns reached from the element DOFs
+        size = 0
+        for k1 in range(ndof):
+            i = pinv[gv[k1]]
+            mark[i] = 1
+            heap_push(heap, &size, i)
+            for k2 in range(rank):
+                W[i][k2] = He[k1][k2]
+        for k1 in range(rank):
+            for k2 in range(rank):
+                Mi[k1][k2] = 0.0
+        while size > 0:
+            j = heap_pop(heap, &size)
+            mark[j] = 0
+            for k1 in range(col_ptr[j],col_ptr[j+1]):
+                i = row_ind[k1]
+                if i > j:
+                    for k2 in range(rank):
+                        W[i][k2] = W[i][k2] - data[k1]*W[j][k2]
+                    if mark[i] == 0:
+                        mark[i] = 1
+                        heap_push(heap, &size, i)
+            for k1 in range(rank):
+                val = W[j][k1]/diag[j]
+                for k2 in range(k1,rank):
+                    Mi[k1][k2] = Mi[k1][k2] + val*W[j][k2]
+            for k1 in range(rank):
+                W[j][k1] = 0.0
+        # -v'(I -/+ A)^-1 v from the symmetric elimination of the upper triangle (I -/+ A is SPD)
+        for k1 in range(rank):
+            vi[k1] = 0.0
+            for k2 in range(ndof):
+                vi[k1] = vi[k1] + He[k2][k1]*ur[gv[k2]]
+            for k2 in range(k1,rank):
+                if dens[e] == 0:
+                    Mi[k1][k2] = -Mi[k1][k2]
+                if k1 == k2:
+                    Mi[k1][k2] = 1.0 - Mi[k1][k2]
+                else:
+                    Mi[k1][k2] = -Mi[k1][k2]
+        sval = 0.0
+        for k1 in range(rank):
+            for k2 in range(k1+1,rank):
+                val = Mi[k1][k2]/Mi[k1][k1]
+                for k3 in range(k2,rank):
+                    Mi[k2][k3] = Mi[k2][k3] - val*Mi[k1][k3]
+                vi[k2] = vi[k2] - val*vi[k1]
+            sval = sval - vi[k1]*vi[k1]/Mi[k1][k1]
+        alpha_r[e] = sval
+    return
+
 def str_cgs(alpha_r, x, Kg_csc, bc_lim, dKe, ug, Nx, Ny, steps=0):
     if steps == 0:
         cgs_0_serial(alpha_r, dKe, ug, Nx, Ny)
@@ -407,3 +538,20 @@ def str_cgs(alpha_r, x, Kg_csc, bc_lim, dKe, ug, Nx, Ny, steps=0):
         else:
             cgs_2J_serial(alpha_r, dens, data, row_ind, col_ptr, bc_lim, dKe, ug, Nx, Ny)
     return
+
+def str_ws(alpha_r, x, factor, bc_lim, H, H_01, H_67, H_0167, ur, Nx, Ny):
+    dens = x.astype("int64")
+    L, D = factor.L_D()
+    L = L.tocsc()
+    data = L.data
+    row_ind = L.indices.astype("int64")
+    col_ptr = L.indptr.astype("int64")
+    diag = D.diagonal()
+    heap = np.empty(len(ur),dtype="int64")
+    mark = np.zeros(len(ur),dtype="int64")
+    pinv = np.empty(len(ur),dtype="int64")
+    pinv[factor.P()] = np.arange(len(ur))
+    W = np.zeros((len(ur),5))
+    ws_serial(alpha_r, dens, data, row_ind, col_ptr, heap, mark, pinv, diag, bc_lim,
+              np.ascontiguousarray(H), np.ascontiguousarray(H_01), np.ascontiguousarray(H_67), np.ascontiguousarray(H_0167), ur, W, Nx, Ny)
+    return
@@ -43,11 +43,12 @@ import os, sys, gc, pickle
 import numpy as np
 from time import time
 from datetime import datetime
-from scipy.sparse import coo_matrix
+from concurrent.futures import ThreadPoolExecutor
+from scipy.sparse import coo_matrix, csc_matrix
 from sksparse.cholmod import analyze
 
 sys.path.append('../../cython/')
-from structural_bsens import str_cgs
+from structural_bsens import str_cgs, str_ws
 from structural_filter import str_filter
 
 #%% Setup
@@ -105,6 +106,39 @@ H_67 = V*np.sqrt(D)
 D,V = np.linalg.eigh(dKe[:,[2,3,4,5]][[2,3,4,5],:])
 H_0167 = V*np.sqrt(D)
 
+# row appended to a growing buffer (capacity doubled when full)
+def append_row(buf, size, row, dtype):
+    if buf is None:
+        buf = np.empty((256,len(row)),dtype=dtype)
+    elif size == len(buf):
+        buf = np.concatenate((buf,np.empty_like(buf)))
+    buf[size] = row
+    return buf
+
+# ascending argsort of only the k smallest (or largest) values
+def partial_argsort(a, k, largest=False):
+    n = len(a)
+    if k >= n:
+        return np.argsort(a)
+    if largest:
+        idx = np.argpartition(a,n-k)[n-k:]
+    else:
+        idx = np.argpartition(a,k)[:k]
+    return idx[np.argsort(a[idx])]
+
+# input file data (None if the input file does not exist)
+def read_input(fid):
+    inp_path = '../input/inp_{:06d}.pckl'.format(fid)
+    if not os.path.exists(inp_path):
+        return None
+    with open(inp_path,'rb') as finp:
+        return pickle.load(finp)
+
+# mesh data (keyed by Ny) and factorization of the initial topology (only for the last Ny and bc_lim)
+mesh_cache = {}
+cached_key = None
+cached_factor = None
+
 # check directories
 if not os.path.exists('../input'):
     os.mkdir('../input')
@@ -156,6 +190,10 @@ tlog.write('====================================================================
 tlog.write('       INPUT ||    FILES :     MESH :   B-COND : ASSEMBLY :    PRE-S :   SOLVER :   POST-S ||----------\n')
 tlog.write('-------------||            (  IT x ):   M-SENS : M-UPDATE :  M-PRE-S : M-SOLVER : M-POST-S ||     TOTAL\n')
 
+writer = ThreadPoolExecutor(max_workers=1)  # output writer
+writes = []
+reader = ThreadPoolExecutor(max_workers=1)  # input reader (prefetches the next input)
+reading = reader.submit(read_input,fid_ini)
 file = 0  # file counter
 fid = fid_ini
 while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid))):
@@ -168,12 +206,12 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
     list_obj_opt = []
     list_ptr2opt = []
     list_ptr2inp = []
-    list_top     = []
-    list_dis     = []
-    list_sen_0   = []
-    list_sen_1   = []
-    list_sen_2   = []
-    list_sen_w   = []
+    list_top     = None  # iteration buffers (filled up to len(list_ptr2inp))
+    list_dis     = None
+    list_sen_0   = None
+    list_sen_1   = None
+    list_sen_2   = None
+    list_sen_w   = None
     list_obj     = []
     list_vol     = []
     list_tim     = []
@@ -191,15 +229,14 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         #%% Read files
         t0 = time()
         
-        # read input file
-        finp = open('../input/'+inp_file,'rb')
-        Ny,bc_pos,bc_rad,ld_pos,ld_rad = pickle.load(finp)
+        # read input file (prefetched while the previous input was computed)
+        Ny,bc_pos,bc_rad,ld_pos,ld_rad = reading.result()
+        reading = reader.submit(read_input,fid+1)
         Ny = int(Ny)
         bc_pos = float(bc_pos)
         bc_rad = float(bc_rad)
         ld_pos = float(ld_pos)
         ld_rad = float(ld_rad)
-        finp.close()
         list_fid += [fid]
         list_inp += [[bc_pos,bc_rad,ld_pos,ld_rad]]
         
@@ -233,23 +270,38 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         ### | (0) | (2) | (4) |
         ### 0_____3_____6_____9
         
-        # coordinates matrix
-        xcoor = (Ny+1)*[list(range(Nx+1))]
-        xcoor = np.ravel(xcoor,'F')
-        ycoor = (Nx+1)*[list(range(Ny+1))]
-        ycoor = np.ravel(ycoor,'C')
-        coor = esize*np.array([xcoor,ycoor]).T
-        coor[:,1] = coor[:,1] - 0.5*Ly
-        
-        # incidence matrix
-        N = Nx*Ny
-        G = 2*(Nx+1)*(Ny+1)
-        inci = np.ndarray([N,4],dtype=int)
-        elem_ids = np.arange(N)
-        inci[:,0] = elem_ids + elem_ids//Ny
-        inci[:,1] = inci[:,0] + Ny + 1
-        inci[:,2] = inci[:,0] + Ny + 2
-        inci[:,3] = inci[:,0] + 1
+        if Ny not in mesh_cache:
+            # nodal y-coordinates (the same in every column of nodes)
+            ycoor = esize*np.arange(Ny+1) - 0.5*Ly
+            
+            # incidence matrix
+            N = Nx*Ny
+            G = 2*(Nx+1)*(Ny+1)
+            inci = np.ndarray([N,4],dtype=int)
+            elem_ids = np.arange(N)
+            inci[:,0] = elem_ids + elem_ids//Ny
+            inci[:,1] = inci[:,0] + Ny + 1
+            inci[:,2] = inci[:,0] + Ny + 2
+            inci[:,3] = inci[:,0] + 1
+            
+            # COO indices
+            eledofs = 2*inci[:,[0,0,1,1,2,2,3,3]] + np.array([0,1,0,1,0,1,0,1])
+            row = np.broadcast_to(eledofs[:,:,None],(N,8,8)).reshape(-1)
+            col = np.broadcast_to(eledofs[:,None,:],(N,8,8)).reshape(-1)
+            
+            # CSC pattern and CSC position of each COO entry
+            K_csc = coo_matrix((np.ones(len(row)),(row,col)),shape=(G,G)).tocsc()
+            csc_keys = np.repeat(np.arange(G),np.diff(K_csc.indptr))*G + K_csc.indices
+            csc_pos = np.searchsorted(csc_keys,col*G+row)
+            
+            # COO entries summed into each CSC entry (padded with the index of a trailing zero)
+            csc_cnt = np.bincount(csc_pos,minlength=K_csc.nnz)
+            csc_order = np.argsort(csc_pos,kind='stable')
+            csc_slot = np.arange(64*N) - np.repeat(np.cumsum(csc_cnt)-csc_cnt,csc_cnt)
+            csc_src = np.full((K_csc.nnz,csc_cnt.max()),64*N)
+            csc_src[csc_pos[csc_order],csc_slot] = csc_order
+            mesh_cache[Ny] = (ycoor,inci,G,K_csc.indptr,K_csc.indices,csc_pos,csc_src)
+        ycoor,inci,G,csc_ptr,csc_ind,csc_pos,csc_src = mesh_cache[Ny]
         
         # write in log    
         t1 = time()
@@ -260,9 +312,9 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         t0 = time()
         
         # free DOFs
-        bc_ycoor = coor[:Ny+1,1]
+        bc_ycoor = ycoor
         bc_mask = abs(bc_ycoor - bc_pos*Ly) < bc_rad*Ly + small
-        if sum(bc_mask) < 2:
+        if np.count_nonzero(bc_mask) < 2:
             print('insufficient constraint')
             iolog.close()
             tlog.close()
@@ -273,17 +325,41 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         bc = np.concatenate((2*bc_ids,2*bc_ids+1))
         freeDofs = np.ones(G,dtype=bool)
         freeDofs[bc] = False
-        sys_size = sum(freeDofs)
+        sys_size = np.count_nonzero(freeDofs)
+        
+        # factor update columns of each element : reduced DOF rows, local columns and values of its H block
+        nodes = inci.copy()
+        freeNodes = (nodes < bc_lim[0]) | (nodes > bc_lim[1])
+        mask = nodes > bc_lim[1]
+        nodes[mask] = nodes[mask] - (bc_lim[1]-bc_lim[0]+1)
+        h_rank = np.zeros(N,dtype=int)
+        h_nnz = np.zeros(N,dtype=int)
+        h_row = np.zeros((N,40),dtype=int)
+        h_col = np.zeros((N,40),dtype=int)
+        h_data = np.zeros((N,40))
+        for He,cmask,cnodes in [(H,freeNodes[:,0] & freeNodes[:,-1],[0,1,2,3]),
+                                (H_01,(~freeNodes[:,0]) & freeNodes[:,-1],[1,2,3]),
+                                (H_67,freeNodes[:,0] & (~freeNodes[:,-1]),[0,1,2]),
+                                (H_0167,(~freeNodes[:,0]) & (~freeNodes[:,-1]),[1,2])]:
+            ele = np.flatnonzero(cmask)
+            lgv,rank = He.shape
+            gv = np.repeat(2*nodes[ele][:,cnodes],2,axis=1)
+            gv[:,1::2] = gv[:,1::2] + 1
+            h_rank[ele] = rank
+            h_nnz[ele] = lgv*rank
+            h_row[ele,:lgv*rank] = np.repeat(gv,rank,axis=1)
+            h_col[ele,:lgv*rank] = np.tile(np.arange(rank),lgv)
+            h_data[ele,:lgv*rank] = He.ravel()
         
         # load vector
         fg = np.zeros(G)
-        ld_ycoor = coor[Nx*(Ny+1):,1]
+        ld_ycoor = ycoor
         ld_mask = abs(ld_ycoor - ld_pos*Ly) < ld_rad*Ly + small
         ld_mask_ele = ld_mask[1:] | ld_mask[:-1]
         ld_ele = np.arange((Nx-1)*Ny,Nx*Ny)
         ld_ele = ld_ele[ld_mask_ele]
         ld_lim = np.array([ld_ele[0],ld_ele[-1]],dtype="int64")
-        ld_num = sum(ld_mask)
+        ld_num = np.count_nonzero(ld_mask)
         ld_ids = np.arange(Nx*(Ny+1),(Nx+1)*(Ny+1))
         ld_ids = ld_ids[ld_mask]
         if ld_num == 0:
@@ -307,26 +383,11 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         # COO data
         pen = np.ones(N)
         pen[~x] = epsk
-        pen = pen.repeat(64)
-        data = pen*np.tile(Kevec,N)
-        
-        # COO indices
-        dof0 = 2*inci[:,0]
-        dof1 = dof0 + 1
-        dof2 = 2*inci[:,1]
-        dof3 = dof2 + 1
-        dof4 = 2*inci[:,2]
-        dof5 = dof4 + 1
-        dof6 = 2*inci[:,3]
-        dof7 = dof6 + 1
-        eledofs = np.array([dof0,dof1,dof2,dof3,dof4,dof5,dof6,dof7])
-        row = eledofs.repeat(8,axis=0).ravel('F')
-        col = eledofs.T.repeat(8,axis=0).ravel('C')
-        
-        # stiffness matrix
-        Kg_coo = coo_matrix((data,(row,col)),shape=(G,G))
-        Kg_csc = Kg_coo.tocsc()
-        Kr = Kg_csc[freeDofs,:][:,freeDofs]
+        data = np.zeros(64*N+1)
+        np.multiply(pen[:,None],Kevec[None,:],out=data[:-1].reshape(N,64))
+        
+        # stiffness matrix (CSC only, its data is refreshed in place from the COO data)
+        Kg_csc = csc_matrix((data[csc_src].sum(axis=1),csc_ind,csc_ptr),shape=(G,G))
         
         # write in log    
         t1 = time()
@@ -339,8 +400,11 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         # initialize displacements vector
         ug  = np.zeros(G)
         
-        # analyze sparse matrix
-        factor = analyze(Kr)
+        # analyze sparse matrix (once per pattern, inputs are grouped by boundary condition)
+        fkey = (Ny,bc_lim[0],bc_lim[1])
+        if fkey != cached_key:
+            Kr = Kg_csc[freeDofs,:][:,freeDofs]
+            factor = analyze(Kr)
         
         # write in log    
         t1 = time()
@@ -350,8 +414,13 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         #%% Solve System
         t0 = time()
         
-        # call solver
-        factor.cholesky_inplace(Kr)
+        # call solver (every input starts from the solid topology, its factor is shared)
+        if fkey != cached_key:
+            factor.cholesky_inplace(Kr)
+            cached_key = fkey
+            cached_factor = factor.copy()  # replaces (frees) the factor of the previous key
+        else:
+            factor = cached_factor.copy()
         ug[freeDofs] = factor(fr)
         
         # write in log    
@@ -369,16 +438,15 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         alpha_r = np.zeros(N)        # raw sensitivity vector
         alpha_f = np.zeros(N)        # filtered sensitivity vector
         alpha_m = np.zeros(N)        # filtered sensitivity vector with momentum
-        fe = np.zeros((sys_size,5))  # auxiliary matrix for WS approach
         Vt = int(N/2)                # target volume
         dVmax = max([1,int(VV*N)])   # maximal volume change
         dXmax = max([2,TV*N])        # maximal topological change
-        vol = sum(x)                 # volume
+        vol = np.count_nonzero(x)    # volume
         
         list_vol = list_vol + [vol/N]  # volume progression
         obj = np.dot(ug,fg)            # objective function
         list_obj = list_obj + [obj]    # objective function progression
-        obj_opt = np.infty
+        obj_opt = np.inf
         keep_going = True
         waiting = 0
         it = 0
@@ -401,96 +469,43 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
             str_cgs(alpha_0, x, Kg_csc, bc_lim, dKe, ug, Nx, Ny, steps=0)
             str_cgs(alpha_1, x, Kg_csc, bc_lim, dKe, ug, Nx, Ny, steps=1)
             str_cgs(alpha_2, x, Kg_csc, bc_lim, dKe, ug, Nx, Ny, steps=2)
-            for e in range(N):
-                n0 = e + (e // Ny)
-                n1 = n0 + Ny + 1
-                n2 = n1 + 1
-                n3 = n0 + 1
-                nodes = np.array([n0,n1,n2,n3])
-                freeNodes = (nodes < bc_lim[0]) | (nodes > bc_lim[1])
-                nodes = nodes[freeNodes]
-                mask = nodes > bc_lim[1]
-                nodes[mask] = nodes[mask] - (bc_lim[1]-bc_lim[0]+1)
-                gv = np.repeat(2*nodes,2)
-                gv[1::2] = gv[1::2] + 1
-                rank = 5
-                if all(freeNodes):
-                    He = H
-                elif (not freeNodes[0]) and (freeNodes[-1]):
-                    He = H_01
-                elif (freeNodes[0]) and (not freeNodes[-1]):
-                    He = H_67
-                else:
-                    He = H_0167
-                    rank = 4
-                Ai = np.zeros((rank,rank))
-                fe[gv,:rank] = He
-                aux = factor.solve_L(factor.apply_P(fe[:,:rank]),use_LDLt_decomposition=False)
-                fe[gv,:rank] = 0.0
-                Ai = aux.T @ aux
-                vi = He.T @ ur[gv]
-                Ii = np.identity(rank)
-                if x[e]:
-                    alpha_r[e] = -vi @ np.linalg.inv(Ii-Ai) @ vi
-                else:
-                    alpha_r[e] = -vi @ np.linalg.inv(Ii+Ai) @ vi
+            str_ws(alpha_r, x, factor, bc_lim, H, H_01, H_67, H_0167, ur, Nx, Ny)
 
+            nit = len(list_ptr2inp)
             list_ptr2inp += [ptr]
-            list_top     += [x.copy()]
-            list_dis     += [ug.copy()]
-            list_sen_0   += [alpha_0.copy()]
-            list_sen_1   += [alpha_1.copy()]
-            list_sen_2   += [alpha_2.copy()]
-            list_sen_w   += [alpha_r.copy()]
+            list_top     = append_row(list_top,nit,np.packbits(x),np.uint8)  # bit-packed topology vectors
+            list_dis     = append_row(list_dis,nit,ug,np.float32)
+            list_sen_0   = append_row(list_sen_0,nit,alpha_0,np.float32)
+            list_sen_1   = append_row(list_sen_1,nit,alpha_1,np.float32)
+            list_sen_2   = append_row(list_sen_2,nit,alpha_2,np.float32)
+            list_sen_w   = append_row(list_sen_w,nit,alpha_r,np.float32)
             
             str_filter(alpha_r, alpha_f, rmax, esize, Nx, Ny, load_lim=ld_lim)
             alpha_m[ld_ele] = 0.0
-            alpha_m = momentum*alpha_m + (1.0-momentum)*(alpha_f/max(abs(alpha_f)))
-            alpha_m = alpha_m/max(abs(alpha_m))
-            alpha_m[ld_ele] = -np.infty
+            alpha_m *= momentum  # in place, max(abs) without the abs copy
+            alpha_m += ((1.0-momentum)/max(alpha_f.max(),-alpha_f.min()))*alpha_f
+            alpha_m /= max(alpha_m.max(),-alpha_m.min())
+            alpha_m[ld_ele] = -np.inf
             t1 = time()
             time_array[7] = time_array[7] + (t1-t0)
     
             # update topology
             t0 = time()
-            solid = np.argwhere(x)[:,0]
-            void = np.argwhere(~x)[:,0]   
-            sorted_solid = np.argsort(alpha_m[solid])
-            sorted_void = np.argsort(alpha_m[void])
+            solid = np.flatnonzero(x)
+            void = np.flatnonzero(~x)
+            # (only the candidates that may change are sorted)
+            sorted_solid = partial_argsort(alpha_m[solid],dVmax+int(dXmax),largest=True)
+            sorted_void = partial_argsort(alpha_m[void],int(dXmax))
+            # elements removed and added (their Cholesky factor updates are applied together)
+            down = []
+            up = []
             # changing volume
             count = 0
             for i in range(min([vol-Vt,dVmax])):
                 es = solid[sorted_solid[-1-i]]
                 x[es] = False
-                Kg_coo.data[64*es:64*(es+1)] = epsk*Kevec
-                # update Cholesky factor (faster for coarse meshes)
-                n0 = es + (es // Ny)
-                n1 = n0 + Ny + 1
-                n2 = n1 + 1
-                n3 = n0 + 1
-                nodes = np.array([n0,n1,n2,n3])
-                freeNodes = (nodes < bc_lim[0]) | (nodes > bc_lim[1])
-                nodes = nodes[freeNodes]
-                mask = nodes > bc_lim[1]
-                nodes[mask] = nodes[mask] - (bc_lim[1]-bc_lim[0]+1)
-                gv = np.repeat(2*nodes,2)
-                gv[1::2] = gv[1::2] + 1
-                lgv = len(gv)
-                rank = 5
-                if all(freeNodes):
-                    hdata = H.ravel()
-                elif (not freeNodes[0]) and (freeNodes[-1]):
-                    hdata = H_01.ravel()
-                elif (freeNodes[0]) and (not freeNodes[-1]):
-                    hdata = H_67.ravel()
-                else:
-                    hdata = H_0167.ravel()
-                    rank = 4
-                hrow  = np.repeat(gv,rank)
-                hcol  = np.tile(np.arange(rank),lgv)
-                H_coo = coo_matrix((hdata,(hrow,hcol)),shape=(sys_size,rank))
-                H_csc = H_coo.tocsc()    
-                factor.update_inplace(H_csc, subtract=True)
+                data[64*es:64*(es+1)] = epsk*Kevec
+                down += [es]
                 count = count + 1
             # constant volume
             for i in range(min([len(sorted_void),int((dXmax-count)/2)])):
@@ -500,69 +515,28 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
                     break
                 x[es] = False
                 x[ev] = True
-                Kg_coo.data[64*es:64*(es+1)] = epsk*Kevec
-                Kg_coo.data[64*ev:64*(ev+1)] = Kevec
-                # update Cholesky factor (faster for coarse meshes)
-                n0 = es + (es // Ny)
-                n1 = n0 + Ny + 1
-                n2 = n1 + 1
-                n3 = n0 + 1
-                nodes = np.array([n0,n1,n2,n3])
-                freeNodes = (nodes < bc_lim[0]) | (nodes > bc_lim[1])
-                nodes = nodes[freeNodes]
-                mask = nodes > bc_lim[1]
-                nodes[mask] = nodes[mask] - (bc_lim[1]-bc_lim[0]+1)
-                gv = np.repeat(2*nodes,2)
-                gv[1::2] = gv[1::2] + 1
-                lgv = len(gv)
-                rank = 5
-                if all(freeNodes):
-                    hdata = H.ravel()
-                elif (not freeNodes[0]) and (freeNodes[-1]):
-                    hdata = H_01.ravel()
-                elif (freeNodes[0]) and (not freeNodes[-1]):
-                    hdata = H_67.ravel()
-                else:
-                    hdata = H_0167.ravel()
-                    rank = 4
-                hrow  = np.repeat(gv,rank)
-                hcol  = np.tile(np.arange(rank),lgv)
-                H_coo = coo_matrix((hdata,(hrow,hcol)),shape=(sys_size,rank))
-                H_csc = H_coo.tocsc()    
-                factor.update_inplace(H_csc, subtract=True)
-                n0 = ev + (ev // Ny )
-                n1 = n0 + Ny + 1
-                n2 = n1 + 1
-                n3 = n0 + 1
-                nodes = np.array([n0,n1,n2,n3])
-                freeNodes = (nodes < bc_lim[0]) | (nodes > bc_lim[1])
-                nodes = nodes[freeNodes]
-                mask = nodes > bc_lim[1]
-                nodes[mask] = nodes[mask] - (bc_lim[1]-bc_lim[0]+1)
-                gv = np.repeat(2*nodes,2)
-                gv[1::2] = gv[1::2] + 1
-                lgv = len(gv)
-                rank = 5
-                if all(freeNodes):
-                    hdata = H.ravel()
-                elif (not freeNodes[0]) and (freeNodes[-1]):
-                    hdata = H_01.ravel()
-                elif (freeNodes[0]) and (not freeNodes[-1]):
-                    hdata = H_67.ravel()
-                else:
-                    hdata = H_0167.ravel()
-                    rank = 4
-                hrow  = np.repeat(gv,rank)
-                hcol  = np.tile(np.arange(rank),lgv)
-                H_coo = coo_matrix((hdata,(hrow,hcol)),shape=(sys_size,rank))
-                H_csc = H_coo.tocsc()     
-                factor.update_inplace(H_csc, subtract=False)
+                data[64*es:64*(es+1)] = epsk*Kevec
+                data[64*ev:64*(ev+1)] = Kevec
+                down += [es]
+                up += [ev]
+            # update Cholesky factor (faster for coarse meshes)
+            for ele,subtract in [(down,True),(up,False)]:
+                if len(ele) > 0:
+                    mask = np.arange(40) < h_nnz[ele][:,None]
+                    offset = np.cumsum(h_rank[ele]) - h_rank[ele]
+                    hrow = h_row[ele][mask]
+                    hcol = (h_col[ele] + offset[:,None])[mask]
+                    H_coo = coo_matrix((h_data[ele][mask],(hrow,hcol)),shape=(sys_size,h_rank[ele].sum()))
+                    factor.update_inplace(H_coo.tocsc(), subtract=subtract)
             t1 = time()
             time_array[8] = time_array[8] + (t1-t0)
             
             # assembly
             t0 = time()
-            Kg_csc = Kg_coo.tocsc()
+            # (only the CSC entries shared with changed elements)
+            changed = np.array(down+up,dtype=int)
+            csc_upd = np.unique(csc_pos[(64*changed[:,None] + np.arange(64)).ravel()])
+            Kg_csc.data[csc_upd] = data[csc_src[csc_upd]].sum(axis=1)
             t1 = time()
             time_array[9] = time_array[9] + (t1-t0)
             
@@ -574,14 +548,14 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
             
             # post-solver
             t0 = time()
-            vol = sum(x)
+            vol = np.count_nonzero(x)
             list_vol = list_vol + [vol/N]
             obj = np.dot(ug,fg)
             list_obj = list_obj + [obj]
             if vol == Vt:
                 # update optimized topology
                 if obj < (1.0-small) * obj_opt:
-                    x_opt = x.copy()
+                    x_opt = np.packbits(x)
                     obj_opt = obj
                     waiting = 0
                 else:
@@ -598,43 +572,11 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         str_cgs(alpha_0, x, Kg_csc, bc_lim, dKe, ug, Nx, Ny, steps=0)
         str_cgs(alpha_1, x, Kg_csc, bc_lim, dKe, ug, Nx, Ny, steps=1)
         str_cgs(alpha_2, x, Kg_csc, bc_lim, dKe, ug, Nx, Ny, steps=2)
-        for e in range(N):
-            n0 = e + (e // Ny)
-            n1 = n0 + Ny + 1
-            n2 = n1 + 1
-            n3 = n0 + 1
-            nodes = np.array([n0,n1,n2,n3])
-            freeNodes = (nodes < bc_lim[0]) | (nodes > bc_lim[1])
-            nodes = nodes[freeNodes]
-            mask = nodes > bc_lim[1]
-            nodes[mask] = nodes[mask] - (bc_lim[1]-bc_lim[0]+1)
-            gv = np.repeat(2*nodes,2)
-            gv[1::2] = gv[1::2] + 1
-            rank = 5
-            if all(freeNodes):
-                He = H
-            elif (not freeNodes[0]) and (freeNodes[-1]):
-                He = H_01
-            elif (freeNodes[0]) and (not freeNodes[-1]):
-                He = H_67
-            else:
-                He = H_0167
-                rank = 4
-            Ai = np.zeros((rank,rank))
-            fe[gv,:rank] = He
-            aux = factor.solve_L(factor.apply_P(fe[:,:rank]),use_LDLt_decomposition=False)
-            fe[gv,:rank] = 0.0
-            Ai = aux.T @ aux
-            vi = He.T @ ur[gv]
-            Ii = np.identity(rank)
-            if x[e]:
-                alpha_r[e] = -vi @ np.linalg.inv(Ii-Ai) @ vi
-            else:
-                alpha_r[e] = -vi @ np.linalg.inv(Ii+Ai) @ vi
+        str_ws(alpha_r, x, factor, bc_lim, H, H_01, H_67, H_0167, ur, Nx, Ny)
         
         # write in log
         tlog.write('-------------||            ({:4d} x ):'.format(it))
-        time_array[12] = sum(time_array[:12])
+        time_array[12] = time_array[:12].sum()
         time_array[7:12] = time_array[7:12]/it
         time_array[13] = (1+small)*it
         tlog.write(' {:6.3f} s : {:6.3f} s : {:6.3f} s : {:6.3f} s : {:6.3f} s ||'.format(
@@ -642,15 +584,16 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
         tlog.write(' {:7.1f} s\n'.format(time_array[12]))
         iolog.write(datetime.now().strftime(' %y/%m/%d-%H:%M:%S\n'))
         
-        list_top_opt += [x_opt.copy()]
+        list_top_opt += [x_opt]
         list_obj_opt += [obj_opt]
+        nit = len(list_ptr2inp)
         list_ptr2inp += [ptr]
-        list_top     += [x.copy()]
-        list_dis     += [ug.copy()]
-        list_sen_0   += [alpha_0.copy()]
-        list_sen_1   += [alpha_1.copy()]
-        list_sen_2   += [alpha_2.copy()]
-        list_sen_w   += [alpha_r.copy()]
+        list_top     = append_row(list_top,nit,np.packbits(x),np.uint8)
+        list_dis     = append_row(list_dis,nit,ug,np.float32)
+        list_sen_0   = append_row(list_sen_0,nit,alpha_0,np.float32)
+        list_sen_1   = append_row(list_sen_1,nit,alpha_1,np.float32)
+        list_sen_2   = append_row(list_sen_2,nit,alpha_2,np.float32)
+        list_sen_w   = append_row(list_sen_w,nit,alpha_r,np.float32)
         list_tim     += [time_array.copy()]
         
         # update pointer
@@ -663,37 +606,26 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
     size_list = len(list_ptr2inp)
     list_ptr2opt += [size_list]
 
-    # save files
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/fid.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_fid,dtype=np.uint32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/inp.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_inp,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/top_opt.npy'.format(
-        fid_ini,fid_lim-1,file),np.packbits(np.array(list_top_opt),axis=1))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/obj_opt.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_obj_opt,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/ptr2opt.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_ptr2opt,dtype=np.uint32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/ptr2inp.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_ptr2inp,dtype=np.uint32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/top.npy'.format(
-        fid_ini,fid_lim-1,file),np.packbits(np.array(list_top),axis=1))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/dis.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_dis,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/sen_0.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_sen_0,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/sen_1.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_sen_1,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/sen_2.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_sen_2,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/sen_w.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_sen_w,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/obj.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_obj,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/vol.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_vol,dtype=np.float32))
-    np.save('./output/run_{:06d}_{:06d}/file_{:05d}/tim.npy'.format(
-        fid_ini,fid_lim-1,file),np.array(list_tim,dtype=np.float32))
+    # save files (written in background while the next file is computed)
+    for write in writes:
+        write.result()
+    arrays = {'fid'    : np.array(list_fid,dtype=np.uint32),
+              'inp'    : np.array(list_inp,dtype=np.float32),
+              'top_opt': np.array(list_top_opt),
+              'obj_opt': np.array(list_obj_opt,dtype=np.float32),
+              'ptr2opt': np.array(list_ptr2opt,dtype=np.uint32),
+              'ptr2inp': np.array(list_ptr2inp,dtype=np.uint32),
+              'top'    : list_top[:size_list],
+              'dis'    : list_dis[:size_list],
+              'sen_0'  : list_sen_0[:size_list],
+              'sen_1'  : list_sen_1[:size_list],
+              'sen_2'  : list_sen_2[:size_list],
+              'sen_w'  : list_sen_w[:size_list],
+              'obj'    : np.array(list_obj,dtype=np.float32),
+              'vol'    : np.array(list_vol,dtype=np.float32),
+              'tim'    : np.array(list_tim,dtype=np.float32)}
+    writes = [writer.submit(np.save,'./output/run_{:06d}_{:06d}/file_{:05d}/{}.npy'.format(
+        fid_ini,fid_lim-1,file,name),array) for name,array in arrays.items()]
     
     del list_fid, list_inp, list_top_opt, list_obj_opt, list_ptr2opt, list_ptr2inp, list_top, list_dis
     del list_sen_0, list_sen_1, list_sen_2, list_sen_w, list_obj, list_vol, list_tim
@@ -703,6 +635,10 @@ while (fid < fid_lim) and (os.path.exists('../input/inp_{:06d}.pckl'.format(fid)
     file = file + 1
 
 #%% close log files
+for write in writes:
+    write.result()
+writer.shutdown()
+reader.shutdown()
 iolog.close()
 tlog.close()
 print('done!')